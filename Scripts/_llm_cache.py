@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import hashlib
+import inspect
+import functools
+import tempfile
+import numpy as np
+
+CACHE_DIR = os.path.join(".cache", "llm")
+SEMANTIC_INDEX = os.path.join(CACHE_DIR, "responses.jsonl")
+
+# Sampling above this temperature is meant to vary between runs, so it is never cached
+MAX_CACHED_TEMPERATURE = 1.0
+
+# Semantic cache: reuse the output of a near-identical prompt with the same model and parameters.
+# Only near-deterministic sampling is served this way, since it trades exactness for cost.
+SEMANTIC_SIMILARITY = 0.95
+MAX_SEMANTIC_TEMPERATURE = 0.3
+
+# Async `prompt -> embedding` function; None keeps the cache to exact matches only
+_embed_fn = None
+# Only requests below this temperature use the semantic cache; set by enable_semantic_cache
+_max_semantic_temperature = MAX_SEMANTIC_TEMPERATURE
+# {request group: (embeddings, written-at times, outputs)}, loaded from SEMANTIC_INDEX on first use
+_semantic_index = None
+
+_TTL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+def parse_ttl(ttl):
+    """Convert a TTL such as "30d" or "12h" to seconds"""
+    return float(ttl[:-1]) * _TTL_UNITS[ttl[-1]]
+
+def cache_path(model, prompt, temperature, top_p, max_tokens):
+    """Content-addressed path for one generation request"""
+    key = json.dumps({
+        "model": model,
+        "prompt": prompt,
+        "temperature": temperature,
+        "top_p": top_p,
+        "max_tokens": max_tokens
+    }, sort_keys=True)
+    return os.path.join(CACHE_DIR, hashlib.sha256(key.encode()).hexdigest() + ".txt")
+
+def read_cached(path, ttl_seconds):
+    if not os.path.exists(path) or time.time() - os.path.getmtime(path) > ttl_seconds:
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def write_cached(path, output):
+    """Write atomically so an interrupted run never leaves a truncated entry"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(output)
+    os.replace(tmp_path, path)
+
+def enable_semantic_cache(embed_fn, max_temperature=MAX_SEMANTIC_TEMPERATURE):
+    """Let requests below max_temperature reuse the output of a prompt within SEMANTIC_SIMILARITY
+    of a cached one (embed_fn=None disables it)"""
+    global _embed_fn, _max_semantic_temperature
+    _embed_fn = embed_fn
+    _max_semantic_temperature = max_temperature
+
+def _group(model, temperature, top_p, max_tokens):
+    return json.dumps([model, temperature, top_p, max_tokens])
+
+def _load_semantic_index():
+    """Load SEMANTIC_INDEX, skipping entries that don't decode
+
+    An interrupted append can leave a truncated last line; it is cut off the file
+    so the next entry starts on a fresh line.
+    """
+    global _semantic_index
+    if _semantic_index is None:
+        _semantic_index = {}
+        if os.path.exists(SEMANTIC_INDEX):
+            with open(SEMANTIC_INDEX, "r+b") as f:
+                complete_length = 0
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        f.truncate(complete_length)
+                        print(f"Dropped a truncated entry at the end of {SEMANTIC_INDEX}")
+                        break
+                    complete_length += len(line)
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        print(f"Skipping an unreadable entry in {SEMANTIC_INDEX}")
+                        continue
+                    _add_to_index(entry["group"], np.asarray(entry["embedding"], dtype=np.float32), entry["time"], entry["output"])
+    return _semantic_index
+
+def _add_to_index(group, embedding, written_at, output):
+    embeddings, times, outputs = _semantic_index.setdefault(group, ([], [], []))
+    embeddings.append(embedding / np.linalg.norm(embedding))
+    times.append(written_at)
+    outputs.append(output)
+
+def semantic_lookup(group, embedding, ttl_seconds):
+    """Output cached for the most similar prompt in the group, if it is similar enough and not expired"""
+    entry = _load_semantic_index().get(group)
+    if entry is None:
+        return None
+    embeddings, times, outputs = entry
+    similarities = np.stack(embeddings) @ (embedding / np.linalg.norm(embedding))
+    similarities[time.time() - np.asarray(times) > ttl_seconds] = -1
+    best = int(np.argmax(similarities))
+    return outputs[best] if similarities[best] > SEMANTIC_SIMILARITY else None
+
+def semantic_store(group, embedding, output):
+    _load_semantic_index()
+    written_at = time.time()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(SEMANTIC_INDEX, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"group": group, "embedding": embedding.tolist(), "time": written_at, "output": output}) + "\n")
+    _add_to_index(group, embedding, written_at, output)
+
+def cached_llm(model, ttl="30d"):
+    """Cache an async `query_*(prompt, temperature, top_p, max_tokens)` function's outputs on disk
+
+    Empty outputs and temperatures above MAX_CACHED_TEMPERATURE are not cached.
+    With the semantic cache enabled, requests below its max temperature also
+    match near-identical prompts.
+    """
+    ttl_seconds = parse_ttl(ttl)
+
+    def decorator(query_fn):
+        signature = inspect.signature(query_fn)
+
+        @functools.wraps(query_fn)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = bound.arguments
+            if params["temperature"] > MAX_CACHED_TEMPERATURE:
+                return await query_fn(*args, **kwargs)
+
+            path = cache_path(model, params["prompt"], params["temperature"], params["top_p"], params["max_tokens"])
+            output = read_cached(path, ttl_seconds)
+            if output is not None:
+                return output
+
+            embedding = None
+            if _embed_fn is not None and params["temperature"] < _max_semantic_temperature:
+                group = _group(model, params["temperature"], params["top_p"], params["max_tokens"])
+                embedding = np.asarray(await _embed_fn(params["prompt"]), dtype=np.float32)
+                output = semantic_lookup(group, embedding, ttl_seconds)
+                if output is not None:
+                    return output
+
+            output = await query_fn(*args, **kwargs)
+            if output:
+                write_cached(path, output)
+                if embedding is not None:
+                    semantic_store(group, embedding, output)
+            return output
+
+        return wrapper
+    return decorator
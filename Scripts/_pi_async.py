@@ -0,0 +1,185 @@
+import os
+import time
+import asyncio
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from withpi import PiClient
+
+try:
+    import h2  # noqa: F401 - httpx needs it for HTTP/2
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+# Fraction of the nominal API rate to target, leaving headroom for clock skew
+RATE_HEADROOM = 0.95
+
+def make_pi_client(api_key, max_connections=64):
+    """PiClient whose requests share one pool of keep-alive connections (HTTP/2 if h2 is installed)"""
+    http_client = httpx.Client(
+        http2=HTTP2,
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    )
+    return PiClient(api_key=api_key, http_client=http_client)
+
+def is_rate_limited(error):
+    """Check whether an exception raised by the PI client is an HTTP 429"""
+    return getattr(error, 'status_code', None) == 429
+
+def retry_after(error, default):
+    """Read the Retry-After header (in seconds) from a rate-limit error"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after', default))
+    except (TypeError, ValueError):
+        return default
+
+class AdaptiveLimiter:
+    """Concurrency limit that grows while requests queue up and halves on HTTP 429"""
+
+    def __init__(self, initial=4, max_concurrency=32, grow_after=5):
+        self.limit = min(initial, max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.grow_after = grow_after
+        self.in_flight = 0
+        self.pending = 0
+        self._successes = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            self.pending += 1
+            await self._cond.wait_for(lambda: self.in_flight < self.limit)
+            self.pending -= 1
+            self.in_flight += 1
+
+    async def release(self, rate_limited=False):
+        async with self._cond:
+            self.in_flight -= 1
+
+            if rate_limited:
+                self.limit = max(1, self.limit // 2)
+                self._successes = 0
+            else:
+                self._successes += 1
+                # Grow only after a run of successes, and only while requests are waiting for a slot
+                if (self._successes >= self.grow_after and self.pending
+                        and self.limit < self.max_concurrency):
+                    self.limit += 1
+                    self._successes = 0
+
+            self._cond.notify_all()
+
+class TokenBucket:
+    """Token-bucket rate limit: bursts of up to `burst` requests, refilled at `rate` per second"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def for_api_limit(cls, requests_per_second):
+        """Bucket running slightly below a documented requests-per-second limit"""
+        return cls(RATE_HEADROOM * requests_per_second)
+
+    async def acquire(self):
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+async def call_with_backoff(limiter, fn, *args, max_attempts=5, bucket=None):
+    """Run a blocking PI call in a worker thread under the limiter, retrying on HTTP 429"""
+    for attempt in range(1, max_attempts + 1):
+        await limiter.acquire()
+        try:
+            if bucket is not None:
+                await bucket.acquire()
+            result = await asyncio.to_thread(fn, *args)
+        except Exception as e:
+            if not is_rate_limited(e) or attempt == max_attempts:
+                await limiter.release()
+                raise
+            await limiter.release(rate_limited=True)
+            delay = retry_after(e, default=2 ** attempt)
+            print(f"Rate limited, retrying in {delay:.1f}s (concurrency limit now {limiter.limit})")
+            await asyncio.sleep(delay)
+        else:
+            await limiter.release()
+            return result
+
+def score_with_retry(fn, *args, max_attempts=5, **kwargs):
+    """Run a single blocking PI call, retrying after Retry-After on HTTP 429"""
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if not is_rate_limited(e) or attempt == max_attempts:
+                raise
+            delay = retry_after(e, default=2 ** attempt)
+            print(f"Rate limited, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def list_text_files(folder_path):
+    """List the txt files in the folder without reading them"""
+    with os.scandir(folder_path) as entries:
+        return [entry.name for entry in entries if entry.is_file() and entry.name.endswith('.txt')]
+
+def iter_text_files(folder_path, filenames):
+    """Yield (filename, text) pairs one file at a time"""
+    for filename in filenames:
+        with open(os.path.join(folder_path, filename), 'r', encoding='utf-8') as f:
+            yield filename, f.read()
+
+async def score_stream(score_fn, text_items, n_texts, on_result, max_concurrency=16,
+                       requests_per_second=None, print_traceback=False):
+    """Score (filename, text) items concurrently as they are read, adapting the number of in-flight requests to the rate limit
+
+    score_fn(text) is the blocking PI call; on_result(index, filename, response) is called as each one succeeds.
+    Failed texts are reported and skipped. Returns the number of texts scored.
+    """
+    # PI calls run in worker threads; the default pool is too small for max_concurrency requests
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=max_concurrency + 1))
+    limiter = AdaptiveLimiter(max_concurrency=max_concurrency)
+    bucket = TokenBucket.for_api_limit(requests_per_second) if requests_per_second else None
+    # A bounded queue keeps only a few texts in memory ahead of the requests in flight
+    queue = asyncio.Queue(maxsize=2 * max_concurrency)
+    scored = 0
+    
+    async def produce():
+        items = enumerate(text_items)
+        # Files are read in a worker thread so reading overlaps with the requests in flight
+        while (item := await asyncio.to_thread(next, items, None)) is not None:
+            await queue.put(item)
+        for _ in range(max_concurrency):
+            await queue.put(None)
+    
+    async def consume():
+        nonlocal scored
+        while (item := await queue.get()) is not None:
+            i, (filename, text) = item
+            try:
+                response = await call_with_backoff(limiter, score_fn, text, bucket=bucket)
+            except Exception as e:
+                print(f"Error scoring {filename}: {e}")
+                if print_traceback:
+                    traceback.print_exc()
+                continue
+            
+            on_result(i, filename, response)
+            scored += 1
+            print(f"Scored {scored}/{n_texts}: {filename} (concurrency limit {limiter.limit})")
+    
+    await asyncio.gather(produce(), *(consume() for _ in range(max_concurrency)))
+    return scored
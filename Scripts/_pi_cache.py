@@ -0,0 +1,142 @@
+import os
+import json
+import sqlite3
+import hashlib
+import functools
+import threading
+from contextlib import closing
+from types import SimpleNamespace
+import numpy as np
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+CACHE_DIR = ".picache"
+CACHE_DB = os.path.join(CACHE_DIR, "scores.sqlite")
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Cosine similarity above which a cached score is reused for a near-identical text.
+# None keeps the cache to exact matches only.
+similarity_threshold = None
+
+_model = None
+_model_lock = threading.Lock()
+
+def _to_json(obj):
+    """json.dumps fallback for SDK (pydantic) objects such as calibrated scoring specs"""
+    if hasattr(obj, 'model_dump'):
+        return obj.model_dump()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def spec_json(scoring_spec):
+    """Canonical JSON for a scoring spec, plain or calibrated"""
+    return json.dumps(scoring_spec, sort_keys=True, default=_to_json)
+
+def cache_key(prompt, text, scoring_spec):
+    """Exact-match key for a (prompt, output, scoring spec) triple"""
+    return hashlib.sha256((prompt + "\0" + text + "\0" + spec_json(scoring_spec)).encode()).hexdigest()
+
+def _calibration_path(scoring_spec, examples):
+    key = hashlib.sha256(json.dumps({'spec': scoring_spec, 'examples': examples}, sort_keys=True, default=_to_json).encode()).hexdigest()
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+def load_calibrated_spec(scoring_spec, examples):
+    """Return the calibrated spec saved for this spec and set of examples, or None"""
+    path = _calibration_path(scoring_spec, examples)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_calibrated_spec(scoring_spec, examples, calibrated_spec):
+    """Persist a calibrated spec so later runs can skip the calibration job"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(_calibration_path(scoring_spec, examples), 'w', encoding='utf-8') as f:
+        f.write(json.dumps(calibrated_spec, default=_to_json))
+
+def set_similarity_threshold(threshold):
+    """Enable the embedding-similarity fallback (None disables it)"""
+    global similarity_threshold
+    if threshold is not None and SentenceTransformer is None:
+        print("sentence-transformers is not installed - semantic cache disabled, exact matches only")
+        threshold = None
+    similarity_threshold = threshold
+
+def _connect():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(CACHE_DB, timeout=30)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS scores ("
+        "key TEXT PRIMARY KEY, grp TEXT, embedding BLOB, total_score REAL, question_scores TEXT)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS scores_grp ON scores (grp)")
+    return conn
+
+def _embed(text):
+    """Embedding of the whole text: the mean of its chunk embeddings, normalized
+    
+    The model truncates its input at max_seq_length word pieces, far shorter than a generated
+    document, so embedding the raw text would only cover its opening section.
+    """
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = SentenceTransformer(EMBEDDING_MODEL)
+        tokenizer = _model.tokenizer
+        window = _model.max_seq_length - 2  # room for the [CLS]/[SEP] tokens
+        ids = tokenizer(text, add_special_tokens=False)["input_ids"]
+        chunks = [tokenizer.decode(ids[i:i + window]) for i in range(0, len(ids), window)] or [text]
+        embedding = _model.encode(chunks, normalize_embeddings=True).mean(axis=0)
+    return (embedding / np.linalg.norm(embedding)).astype(np.float32)
+
+def _lookup(key, group, text):
+    """Return (cached response or None, embedding of the text or None)
+    
+    The text is only embedded on an exact-match miss with the semantic fallback enabled;
+    the embedding is returned so the caller can store it without embedding the text again.
+    """
+    embedding = None
+    with closing(_connect()) as conn, conn:
+        row = conn.execute("SELECT total_score, question_scores FROM scores WHERE key = ?", (key,)).fetchone()
+        if row is None and similarity_threshold is not None:
+            embedding = _embed(text)
+            rows = conn.execute("SELECT embedding, total_score, question_scores FROM scores WHERE grp = ? AND embedding IS NOT NULL", (group,)).fetchall()
+            if rows:
+                embeddings = np.stack([np.frombuffer(r[0], dtype=np.float32) for r in rows])
+                similarities = embeddings @ embedding
+                best = int(np.argmax(similarities))
+                if similarities[best] > similarity_threshold:
+                    row = rows[best][1:]
+    if row is None:
+        return None, embedding
+    return SimpleNamespace(total_score=row[0], question_scores=json.loads(row[1])), embedding
+
+def _store(key, group, embedding, response):
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?)",
+            (key, group, None if embedding is None else embedding.tobytes(),
+             response.total_score, json.dumps(dict(response.question_scores)))
+        )
+
+def cache_scores(score_fn):
+    """Cache a `(pi_client, prompt, text, scoring_spec) -> response` scoring function on disk
+
+    Hits return an object exposing `total_score` and `question_scores`, like the PI response.
+    """
+    @functools.wraps(score_fn)
+    def wrapper(pi_client, prompt, text, scoring_spec):
+        key = cache_key(prompt, text, scoring_spec)
+        # Semantic matches are only considered for the same prompt and scoring spec
+        group = cache_key(prompt, "", scoring_spec)
+
+        cached, embedding = _lookup(key, group, text)
+        if cached is not None:
+            return cached
+
+        response = score_fn(pi_client, prompt, text, scoring_spec)
+        _store(key, group, embedding, response)
+        return response
+    return wrapper
@@ -1,16 +1,20 @@
-import os
+import asyncio
+from itertools import islice
+import numpy as np
 import pandas as pd
-from withpi import PiClient
 from withpi_utils import stream
+from _pi_async import make_pi_client, list_text_files, iter_text_files, score_stream
+from _pi_cache import cache_scores, set_similarity_threshold, load_calibrated_spec, save_calibrated_spec
 
-def read_text_files(folder_path):
-    """Read all txt files from the folder"""
-    texts = {}
-    for filename in os.listdir(folder_path):
-        if filename.endswith('.txt'):
-            with open(os.path.join(folder_path, filename), 'r', encoding='utf-8') as f:
-                texts[filename] = f.read()
-    return texts
+# Output columns for each PI question label
+QUESTION_COLUMNS = {
+    'calibrated_realism': 'Realism',
+    'calibrated_prompt_adherence': 'Prompt Adherence',
+    'calibrated_clarity': 'Clarity',
+    'calibrated_factual_consistency': 'Factual Consistency',
+    'calibrated_completeness': 'Completeness',
+    'calibrated_technical_accuracy': 'Technical Accuracy'
+}
 
 def create_scoring_spec(observations):
     """Create the scoring specification"""
@@ -41,14 +45,12 @@ def create_scoring_spec(observations):
         }
     ]
 
-def create_examples(prompt, texts, original_scores_df, num_examples=10):
+def create_examples(prompt, text_items, original_scores_df, num_examples=10):
     """Create examples for calibration from existing texts with scores"""
     examples = []
     
     # Select a subset of texts for calibration examples
-    text_items = list(texts.items())[:num_examples]
-    
-    for filename, text in text_items:
+    for filename, text in islice(text_items, num_examples):
         # Get the original score for this model if it exists
         score_row = original_scores_df[original_scores_df['model_name'] == filename]
         
@@ -108,6 +110,37 @@ def calibrate_scoring_system(pi, scoring_spec, examples):
         traceback.print_exc()
         return None
 
+def calibrate_locally(df_scores, original_scores_df, mode):
+    """Post-hoc calibration of raw scores against the original score distribution, without a PI job
+
+    cdf: map each score's rank within this run onto the quantiles of the original scores.
+    meanshift: shift scores so their mean matches the original mean, clipped to [0, 1].
+    """
+    df_calibrated = df_scores.copy()
+    
+    for column in ['calibrated_total_score', *QUESTION_COLUMNS]:
+        original_column = column.removeprefix('calibrated_')
+        if original_column not in original_scores_df.columns or df_scores.empty:
+            continue
+        
+        history = original_scores_df[original_column].dropna().to_numpy()
+        if len(history) == 0:
+            print(f"No original scores in column '{original_column}', leaving {column} uncalibrated")
+            continue
+        raw = df_scores[column].to_numpy()
+        
+        if mode == 'cdf':
+            n = len(raw)
+            quantiles = (df_scores[column].rank().to_numpy() - 1) / (n - 1) if n > 1 else np.full(n, 0.5)
+            values = np.interp(quantiles, np.linspace(0, 1, len(history)), np.sort(history))
+        else:
+            values = np.clip(raw + history.mean() - raw.mean(), 0, 1)
+        
+        df_calibrated[column] = values.round(4)
+    
+    return df_calibrated
+
+@cache_scores
 def score_with_calibrated_spec(pi, prompt, text, scoring_spec_calibrated):
     """Score a text using calibrated scoring spec"""
     response = pi.scoring_system.score(
@@ -117,18 +150,55 @@ def score_with_calibrated_spec(pi, prompt, text, scoring_spec_calibrated):
     )
     return response
 
+async def score_all(pi, prompt, text_items, scoring_spec_calibrated, n_texts, max_concurrency=20, requests_per_second=None):
+    """Score texts concurrently as they are read, collecting the calibrated scores into a DataFrame"""
+    # Results are filled by index into preallocated columns
+    names = np.empty(n_texts, dtype=object)
+    totals = np.empty(n_texts, dtype=np.float64)
+    questions = {column: np.empty(n_texts, dtype=np.float64) for column in QUESTION_COLUMNS}
+    scored = np.zeros(n_texts, dtype=bool)
+    
+    def store(i, filename, response):
+        question_scores = response.question_scores
+        names[i] = filename
+        totals[i] = response.total_score
+        for column, label in QUESTION_COLUMNS.items():
+            questions[column][i] = question_scores.get(label, 0)
+        scored[i] = True
+    
+    def score_fn(text):
+        return score_with_calibrated_spec(pi, prompt, text, scoring_spec_calibrated)
+    
+    await score_stream(score_fn, text_items, n_texts, store, max_concurrency, requests_per_second)
+    
+    return pd.DataFrame({
+        'model_name': names[scored],
+        'calibrated_total_score': totals[scored].round(4),
+        **{column: values[scored].round(4) for column, values in questions.items()}
+    })
+
 def main():
     # Configuration
     PI_API_KEY = input("Enter your PI API key: ").strip()
     folder_path = input("Enter the folder path containing txt files: ").strip()
     prompt_path = input("Enter the path to the prompt file (txt): ").strip()
     original_scores_csv = input("Enter path to original PI scores CSV: ").strip()
-    num_calibration_examples = int(input("Number of examples to use for calibration (default 10): ").strip() or "10")
+    calibration_mode = input("Calibration mode - pi, cdf or meanshift (default pi): ").strip().lower() or "pi"
+    if calibration_mode not in ('pi', 'cdf', 'meanshift'):
+        print(f"Unknown calibration mode: {calibration_mode}")
+        return
+    if calibration_mode == 'pi':
+        num_calibration_examples = int(input("Number of examples to use for calibration (default 10): ").strip() or "10")
+    max_concurrency = int(input("Maximum concurrent scoring requests (default 20): ").strip() or "20")
+    requests_per_second = float(input("PI API requests-per-second limit (blank for no limit): ").strip() or "0")
+    similarity_threshold = input("Semantic cache similarity threshold, e.g. 0.97 (blank for exact matches only): ").strip()
     output_csv = input("Enter output CSV filename (default: pi_scores_calibrated.csv): ").strip()
     
     if not output_csv:
         output_csv = "pi_scores_calibrated.csv"
     
+    set_similarity_threshold(float(similarity_threshold) if similarity_threshold else None)
+    
     # Observations for realism question
     observations = """
     Technical jargon/syntax used (output syntax), numbers, unique ticket numbers.
@@ -147,22 +217,22 @@ def main():
     
     # Initialize PI client
     print("\nInitializing PI client...")
-    pi = PiClient(api_key=PI_API_KEY)
+    pi = make_pi_client(PI_API_KEY, max_connections=max_concurrency)
     
     # Read prompt
     print("Reading prompt...")
     with open(prompt_path, 'r', encoding='utf-8') as f:
         prompt = f.read()
     
-    # Read texts
-    print("Reading text files...")
-    texts = read_text_files(folder_path)
+    # List texts; their contents are read lazily as they are needed
+    print("Listing text files...")
+    filenames = list_text_files(folder_path)
     
-    if not texts:
+    if not filenames:
         print("No txt files found in the specified folder!")
         return
     
-    print(f"Found {len(texts)} text files")
+    print(f"Found {len(filenames)} text files")
     
     # Load original scores first (needed for calibration examples)
     print("Loading original scores...")
@@ -172,47 +242,42 @@ def main():
     print("Creating scoring spec...")
     spec = create_scoring_spec(observations)
     
-    # Create calibration examples with scores
-    print(f"Creating {num_calibration_examples} calibration examples with scores...")
-    calib_examples = create_examples(prompt, texts, df_original, num_calibration_examples)
-    
-    # Calibrate
-    print("Starting calibration...")
-    calibrated_spec = calibrate_scoring_system(pi, spec, calib_examples)
-    
-    if calibrated_spec is None:
-        print("\nCalibration failed! Cannot continue.")
-        return
-    
-    # Score all texts with calibrated spec
-    print("\nScoring all texts with calibrated scoring spec...")
-    calibrated_results = []
-    
-    for i, (filename, text) in enumerate(texts.items(), 1):
-        print(f"Scoring {i}/{len(texts)}: {filename}")
+    if calibration_mode == 'pi':
+        # Create calibration examples with scores
+        print(f"Creating {num_calibration_examples} calibration examples with scores...")
+        calib_examples = create_examples(prompt, iter_text_files(folder_path, filenames), df_original, num_calibration_examples)
+        
+        # Calibrate, unless this spec was already calibrated on the same examples
+        calibrated_spec = load_calibrated_spec(spec, calib_examples)
         
-        try:
-            response = score_with_calibrated_spec(pi, prompt, text, calibrated_spec)
-            question_scores = response.question_scores
+        if calibrated_spec is not None:
+            print("Using cached calibrated scoring spec")
+        else:
+            print("Starting calibration...")
+            calibrated_spec = calibrate_scoring_system(pi, spec, calib_examples)
             
-            calibrated_results.append({
-                'model_name': filename,
-                'calibrated_total_score': round(response.total_score, 4),
-                'calibrated_realism': round(question_scores.get('Realism', 0), 4),
-                'calibrated_prompt_adherence': round(question_scores.get('Prompt Adherence', 0), 4),
-                'calibrated_clarity': round(question_scores.get('Clarity', 0), 4),
-                'calibrated_factual_consistency': round(question_scores.get('Factual Consistency', 0), 4),
-                'calibrated_completeness': round(question_scores.get('Completeness', 0), 4),
-                'calibrated_technical_accuracy': round(question_scores.get('Technical Accuracy', 0), 4)
-            })
+            if calibrated_spec is None:
+                print("\nCalibration failed! Cannot continue.")
+                return
             
-        except Exception as e:
-            print(f"Error scoring {filename}: {e}")
-            continue
+            save_calibrated_spec(spec, calib_examples, calibrated_spec)
+    else:
+        # Local calibration post-processes scores from the uncalibrated spec
+        print(f"Using local {calibration_mode} calibration, skipping the PI calibration job")
+        calibrated_spec = spec
+    
+    # Score all texts with calibrated spec
+    print(f"\nScoring all texts (up to {max_concurrency} concurrent requests)...")
+    df_calibrated = asyncio.run(score_all(
+        pi, prompt, iter_text_files(folder_path, filenames), calibrated_spec, len(filenames),
+        max_concurrency, requests_per_second=requests_per_second
+    ))
+    
+    if calibration_mode != 'pi':
+        df_calibrated = calibrate_locally(df_calibrated, df_original, calibration_mode)
     
     # Merge with original scores
     print("\nMerging with original scores...")
-    df_calibrated = pd.DataFrame(calibrated_results)
     
     comparison_df = pd.merge(df_original, df_calibrated, on='model_name', how='inner')
     
@@ -1,9 +1,17 @@
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+GOLDILOCKS = "Goldilocks (High PI + High Consensus)"
+CREATIVE_EXCELLENCE = "Creative Excellence (High PI + Low Consensus)"
+SAFE_CONSENSUS = "Safe Consensus (Low PI + High Consensus)"
+AVOID = "Avoid (Low PI + Low Consensus)"
+QUADRANTS = [GOLDILOCKS, CREATIVE_EXCELLENCE, SAFE_CONSENSUS, AVOID]
+
 def load_and_merge_scores(pi_csv, ensemble_csv):
     """Load and merge PI and ensemble scores"""
+    # Every column is kept: save_quadrant_results writes the whole merged frame
     df_pi = pd.read_csv(pi_csv)
     df_ensemble = pd.read_csv(ensemble_csv)
     
@@ -12,19 +20,35 @@ def load_and_merge_scores(pi_csv, ensemble_csv):
     
     return merged
 
-def classify_quadrant(row, pi_median, consensus_median):
-    """Classify each model into a quadrant"""
-    pi_score = row['calibrated_total_score'] if 'calibrated_total_score' in row else row['total_score']
-    consensus_score = row['final_consensus_score']
-    
-    if pi_score >= pi_median and consensus_score >= consensus_median:
-        return "Goldilocks (High PI + High Consensus)"
-    elif pi_score >= pi_median and consensus_score < consensus_median:
-        return "Creative Excellence (High PI + Low Consensus)"
-    elif pi_score < pi_median and consensus_score >= consensus_median:
-        return "Safe Consensus (Low PI + High Consensus)"
-    else:
-        return "Avoid (Low PI + Low Consensus)"
+def median(values):
+    """Median in O(N) via np.partition, skipping missing values like Series.median"""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    n = len(values)
+    if n == 0:
+        return np.nan
+    
+    mid = n // 2
+    if n % 2:
+        return float(np.partition(values, mid)[mid])
+    
+    partitioned = np.partition(values, [mid - 1, mid])
+    return float((partitioned[mid - 1] + partitioned[mid]) / 2)
+
+def classify_quadrants(df, pi_col, pi_median, consensus_median):
+    """Classify every model into a quadrant"""
+    pi_scores = df[pi_col].to_numpy()
+    consensus_scores = df['final_consensus_score'].to_numpy()
+    
+    # Explicit < comparisons (rather than negating >=) so missing scores still fall through to Avoid
+    high_pi, low_pi = pi_scores >= pi_median, pi_scores < pi_median
+    high_consensus, low_consensus = consensus_scores >= consensus_median, consensus_scores < consensus_median
+    
+    return np.select(
+        [high_pi & high_consensus, high_pi & low_consensus, low_pi & high_consensus],
+        [GOLDILOCKS, CREATIVE_EXCELLENCE, SAFE_CONSENSUS],
+        default=AVOID
+    )
 
 def analyze_quadrants(df):
     """Analyze and categorize models into quadrants"""
@@ -33,8 +57,8 @@ def analyze_quadrants(df):
     pi_col = 'calibrated_total_score' if 'calibrated_total_score' in df.columns else 'total_score'
     
     # Calculate medians
-    pi_median = df[pi_col].median()
-    consensus_median = df['final_consensus_score'].median()
+    pi_median = median(df[pi_col].to_numpy())
+    consensus_median = median(df['final_consensus_score'].to_numpy())
     
     print("\n" + "="*70)
     print("THRESHOLD VALUES")
@@ -43,10 +67,13 @@ def analyze_quadrants(df):
     print(f"Consensus Score Median: {consensus_median:.4f}")
     
     # Classify each model
-    df['quadrant'] = df.apply(lambda row: classify_quadrant(row, pi_median, consensus_median), axis=1)
+    # Categorical keeps the repeated labels as int8 codes for counting, sorting and filtering
+    df['quadrant'] = pd.Categorical(classify_quadrants(df, pi_col, pi_median, consensus_median), categories=QUADRANTS)
     
     # Count models in each quadrant
-    quadrant_counts = df['quadrant'].value_counts()
+    counts = np.bincount(df['quadrant'].cat.codes, minlength=len(QUADRANTS))
+    quadrant_counts = pd.Series(counts, index=QUADRANTS).sort_values(ascending=False, kind='stable')
+    quadrant_counts = quadrant_counts[quadrant_counts > 0]
     
     print("\n" + "="*70)
     print("QUADRANT DISTRIBUTION")
@@ -64,14 +91,7 @@ def print_quadrant_details(df, pi_col):
     print("TOP MODELS BY QUADRANT")
     print("="*70)
     
-    quadrants = [
-        "Goldilocks (High PI + High Consensus)",
-        "Creative Excellence (High PI + Low Consensus)",
-        "Safe Consensus (Low PI + High Consensus)",
-        "Avoid (Low PI + Low Consensus)"
-    ]
-    
-    for quadrant in quadrants:
+    for quadrant in QUADRANTS:
         quadrant_df = df[df['quadrant'] == quadrant]
         
         if len(quadrant_df) == 0:
@@ -84,9 +104,10 @@ def print_quadrant_details(df, pi_col):
         # Sort by PI score within quadrant
         top_models = quadrant_df.nlargest(5, pi_col)
         
-        for idx, row in top_models.iterrows():
-            print(f"  {row['model_name']}")
-            print(f"    PI Score: {row[pi_col]:.4f} | Consensus Score: {row['final_consensus_score']:.4f}")
+        columns = ['model_name', pi_col, 'final_consensus_score']
+        for model_name, pi_score, consensus_score in top_models[columns].itertuples(index=False, name=None):
+            print(f"  {model_name}")
+            print(f"    PI Score: {pi_score:.4f} | Consensus Score: {consensus_score:.4f}")
 
 def plot_quadrants(df, pi_col, pi_median, consensus_median, output_file='quadrant_plot.png'):
     """Create scatter plot with quadrants"""
@@ -95,10 +116,10 @@ def plot_quadrants(df, pi_col, pi_median, consensus_median, output_file='quadran
     
     # Define colors for each quadrant
     colors = {
-        "Goldilocks (High PI + High Consensus)": '#2ecc71',  # Green
-        "Creative Excellence (High PI + Low Consensus)": '#3498db',  # Blue
-        "Safe Consensus (Low PI + High Consensus)": '#f39c12',  # Orange
-        "Avoid (Low PI + Low Consensus)": '#e74c3c'  # Red
+        GOLDILOCKS: '#2ecc71',  # Green
+        CREATIVE_EXCELLENCE: '#3498db',  # Blue
+        SAFE_CONSENSUS: '#f39c12',  # Orange
+        AVOID: '#e74c3c'  # Red
     }
     
     # Plot each quadrant
@@ -151,7 +172,8 @@ def plot_quadrants(df, pi_col, pi_median, consensus_median, output_file='quadran
 
 def save_quadrant_results(df, output_csv='quadrant_analysis.csv'):
     """Save results with quadrant classifications"""
-    df_sorted = df.sort_values('quadrant')
+    # Sort by label text, not category order, so rows come out grouped alphabetically as before
+    df_sorted = df.sort_values('quadrant', key=lambda quadrant: quadrant.astype(object))
     df_sorted.to_csv(output_csv, index=False)
     print(f"✓ Quadrant analysis saved to {output_csv}")
 
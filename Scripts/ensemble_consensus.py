@@ -1,72 +1,129 @@
 import os
+import hashlib
+import itertools
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+import scipy.sparse
+import sklearn
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import pandas as pd
 
-def read_text_files(folder_path):
-    """Read all txt files from the folder"""
-    texts = {}
-    for filename in os.listdir(folder_path):
-        if filename.endswith('.txt'):
-            with open(os.path.join(folder_path, filename), 'r', encoding='utf-8') as f:
-                texts[filename] = f.read()
-    return texts
+TFIDF_CACHE_DIR = ".tfidf"
 
-def calculate_consensus_similarity(texts):
-    """Calculate average cosine similarity of each text against all others"""
-    text_list = list(texts.values())
+try:
+    from numba import njit, types
+    from numba.typed import Dict
+except ImportError:
+    njit = None
+
+def read_text_file(path):
+    """Read a single txt file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def read_text_files(folder_path, max_workers=32):
+    """Read all txt files from the folder, overlapping the reads in a thread pool"""
+    with os.scandir(folder_path) as entries:
+        files = [entry for entry in entries if entry.is_file() and entry.name.endswith('.txt')]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        contents = executor.map(read_text_file, [entry.path for entry in files])
+        return dict(zip((entry.name for entry in files), contents))
+
+def get_tfidf(documents):
+    """Fit TF-IDF over the documents, reusing the matrix saved for an identical corpus and vectorizer"""
     vectorizer = TfidfVectorizer()
-    tfidf_matrix = vectorizer.fit_transform(text_list)
+    # The key covers the vectorizer settings and sklearn version too, so changing either refits
+    settings = repr(sorted(vectorizer.get_params().items())) + sklearn.__version__
+    key = hashlib.sha256((settings + "\0" + "\0".join(documents)).encode()).hexdigest()
+    matrix_path = os.path.join(TFIDF_CACHE_DIR, f"{key}.npz")
+    
+    if os.path.exists(matrix_path):
+        return scipy.sparse.load_npz(matrix_path)
+    
+    tfidf_matrix = vectorizer.fit_transform(documents)
     
-    similarity_scores = {}
-    for i, filename in enumerate(texts.keys()):
-        similarities = cosine_similarity(tfidf_matrix[i:i+1], tfidf_matrix)[0]
-        avg_similarity = (np.sum(similarities) - 1) / (len(similarities) - 1) if len(similarities) > 1 else 0
-        similarity_scores[filename] = avg_similarity
+    os.makedirs(TFIDF_CACHE_DIR, exist_ok=True)
+    scipy.sparse.save_npz(matrix_path, tfidf_matrix)
     
-    return similarity_scores
+    return tfidf_matrix
 
-def calculate_prompt_similarity(prompt, texts):
-    """Calculate cosine similarity between prompt and each text"""
-    all_texts = [prompt] + list(texts.values())
-    vectorizer = TfidfVectorizer()
-    tfidf_matrix = vectorizer.fit_transform(all_texts)
+def calculate_similarity_matrix(prompt, texts):
+    """Fit one TF-IDF model over the prompt and all texts and return pairwise cosine similarities"""
+    tfidf_matrix = get_tfidf([prompt] + list(texts.values()))
     
-    # Prompt is at index 0
-    prompt_vector = tfidf_matrix[0:1]
+    # TF-IDF rows are already L2-normalised, so one sparse product gives every cosine similarity.
+    # Prompt is at index 0, texts follow in order
+    return (tfidf_matrix @ tfidf_matrix.T).toarray()
+
+def calculate_consensus_similarity(texts, similarity_matrix):
+    """Calculate average cosine similarity of each text against all others"""
+    text_similarities = similarity_matrix[1:, 1:]
+    n = len(texts)
+    if n < 2:
+        return dict.fromkeys(texts.keys(), 0)
     
-    similarity_scores = {}
-    for i, filename in enumerate(texts.keys(), start=1):
-        text_vector = tfidf_matrix[i:i+1]
-        similarity = cosine_similarity(prompt_vector, text_vector)[0][0]
-        similarity_scores[filename] = similarity
+    # Drop the self-similarity of 1 on the diagonal
+    avg_similarities = (text_similarities.sum(axis=1) - 1) / (n - 1)
     
-    return similarity_scores
+    return dict(zip(texts.keys(), avg_similarities))
 
-def calculate_repetition_rate(text):
-    """Calculate repetition rate in the text"""
+def calculate_prompt_similarity(texts, similarity_matrix):
+    """Calculate cosine similarity between prompt and each text"""
+    return dict(zip(texts.keys(), similarity_matrix[0, 1:]))
+
+def new_vocabulary():
+    """Word -> id dict shared across the corpus; an unseen word gets the next id on lookup"""
+    return defaultdict(itertools.count().__next__)
+
+def encode_words(text, vocabulary):
+    """Encode the lowercased words of a text as int64 ids, in the same pass that adds new words to the vocabulary"""
     words = text.lower().split()
-    if len(words) < 2:
-        return 0.0
-    
-    bigrams = [' '.join(words[i:i+2]) for i in range(len(words)-1)] # Count repeated bigrams
-    if len(bigrams) == 0:
+    return np.fromiter(map(vocabulary.__getitem__, words), dtype=np.int64, count=len(words))
+
+# Loading the numba kernel from its on-disk cache costs ~0.3 s per process (~1.5 s when it compiles),
+# and it saves only ~6 ms per 141k words over NumPy, so it is used only for corpora this large
+NUMBA_MIN_WORDS = 10_000_000
+
+def _numpy_repetition_rate(ids):
+    codes = (ids[:-1] << 32) | ids[1:]
+    return 1 - (np.unique(codes).size / codes.size)
+
+if njit is not None:
+    @njit(cache=True, nogil=True)
+    def _numba_repetition_rate(ids):
+        # Count each adjacent pair, packed into one int64 key, in a single pass
+        counts = Dict.empty(key_type=types.int64, value_type=types.int64)
+        for i in range(len(ids) - 1):
+            key = (ids[i] << 32) | ids[i + 1]
+            counts[key] = counts.get(key, 0) + 1
+        return 1 - len(counts) / (len(ids) - 1)
+else:
+    _numba_repetition_rate = None
+
+def calculate_repetition_rate(ids, use_numba=False):
+    """Calculate bigram repetition rate from a text's encoded word ids"""
+    if len(ids) < 2:
         return 0.0
     
-    unique_bigrams = len(set(bigrams))
-    repetition_rate = 1 - (unique_bigrams / len(bigrams))
-    
-    return repetition_rate
+    if use_numba and _numba_repetition_rate is not None:
+        return _numba_repetition_rate(ids)
+    return _numpy_repetition_rate(ids)
 
 def calculate_metrics(prompt, texts):
     """Calculate all metrics for each text"""
-    consensus_scores = calculate_consensus_similarity(texts)
-    prompt_scores = calculate_prompt_similarity(prompt, texts)
+    similarity_matrix = calculate_similarity_matrix(prompt, texts)
+    consensus_scores = calculate_consensus_similarity(texts, similarity_matrix)
+    prompt_scores = calculate_prompt_similarity(texts, similarity_matrix)
+    
+    # One vocabulary for the corpus, built up while each text is encoded; the ids are shared by the per-text metrics
+    vocabulary = new_vocabulary()
+    word_ids = {filename: encode_words(text, vocabulary) for filename, text in texts.items()}
+    use_numba = sum(map(len, word_ids.values())) >= NUMBA_MIN_WORDS
     
     results = []
     for filename, text in texts.items():
-        repetition_rate = calculate_repetition_rate(text)
+        repetition_rate = calculate_repetition_rate(word_ids[filename], use_numba)
         w_rep_inv = 1 - repetition_rate # inverse repetition rate
         
         consensus_score = (
@@ -1,7 +1,8 @@
 import os
 import pandas as pd
-from withpi import PiClient
 from withpi_utils import stream
+from _pi_async import make_pi_client, score_with_retry
+from _pi_cache import cache_scores, set_similarity_threshold
 
 def create_evaluation_scoring_spec():
     """Create scoring specification for version 1.3 evaluation"""
@@ -40,16 +41,22 @@ def create_evaluation_scoring_spec():
         }
     ]
 
+@cache_scores
+def score_with_backoff(pi_client, prompt, generated_output, scoring_spec):
+    """Send a single scoring request, retrying after Retry-After on HTTP 429"""
+    return score_with_retry(
+        pi_client.scoring_system.score,
+        llm_input=prompt,
+        llm_output=generated_output,
+        scoring_spec=scoring_spec
+    )
+
 def score_generated_output(pi_client, prompt, generated_output, scoring_spec):
     """Score the generated output using PI scorer"""
     print("\nScoring generated output with PI scorer...")
     
     try:
-        response = pi_client.scoring_system.score(
-            llm_input=prompt,
-            llm_output=generated_output,
-            scoring_spec=scoring_spec
-        )
+        response = score_with_backoff(pi_client, prompt, generated_output, scoring_spec)
         
         return {
             'total_score': response.total_score,
@@ -105,11 +112,7 @@ def calibrate_and_score(pi_client, prompt, generated_output, scoring_spec):
         
         # Score with calibrated spec
         print("\nScoring with calibrated spec...")
-        calibrated_response = pi_client.scoring_system.score(
-            llm_input=prompt,
-            llm_output=generated_output,
-            scoring_spec=calibrated_spec
-        )
+        calibrated_response = score_with_backoff(pi_client, prompt, generated_output, calibrated_spec)
         
         return {
             'total_score': calibrated_response.total_score,
@@ -141,14 +144,17 @@ def main():
     PI_API_KEY = input("\nEnter your PI API key: ").strip()
     prompt_file = input("Enter path to prompt file (txt): ").strip()
     generated_file = input("Enter path to generated v1.3 file (txt): ").strip()
+    similarity_threshold = input("Semantic cache similarity threshold, e.g. 0.97 (blank for exact matches only): ").strip()
     output_csv = input("Enter output CSV filename (default: v1.3_evaluation.csv): ").strip()
     
     if not output_csv:
         output_csv = "v1.3_evaluation.csv"
     
+    set_similarity_threshold(float(similarity_threshold) if similarity_threshold else None)
+    
     # Initialize PI client
     print("\nInitializing PI client...")
-    pi = PiClient(api_key=PI_API_KEY)
+    pi = make_pi_client(PI_API_KEY)
     
     # Read files
     print("Reading prompt...")
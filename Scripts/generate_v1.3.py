@@ -1,38 +1,12 @@
 import os
-from anthropic import Anthropic
-
-def query_claude(prompt, temperature=0.7, top_p=0.9, max_tokens=2000):
-    """Generate using Claude 3.5 Sonnet via Anthropic API"""
-    api_key = os.getenv("ANTHROPIC_API_KEY")
-    
-    if not api_key:
-        print("Error: ANTHROPIC_API_KEY environment variable not set!")
-        print("Please set it with: export ANTHROPIC_API_KEY=your_key_here")
-        return None
-
-    client = Anthropic(api_key=api_key)
-
-    try:
-        print("\nGenerating with Claude 3.5 Sonnet...")
-        message = client.messages.create(
-            model="claude-3-7-sonnet-20250219",
-            max_tokens=max_tokens,
-            temperature=temperature,
-            top_p=top_p,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
-        return message.content[0].text
-    except Exception as e:
-        print(f"Claude request failed: {e}")
-        return None
+import asyncio
+from text_generation import call_llm
 
 def main():
     MODEL = "claude-3-7-sonnet-20250219"
     TEMPERATURE = 0.7
     TOP_P = 0.9
-    MAX_TOKENS = 20000
+    MAX_TOKENS = 4000
     
     
     # Get inputs
@@ -50,7 +24,17 @@ def main():
     print(f"Prompt length: {len(prompt)} characters")
     
     # Generate
-    generated_text = query_claude(prompt, TEMPERATURE, TOP_P, MAX_TOKENS)
+    if not os.getenv("ANTHROPIC_API_KEY"):
+        print("Error: ANTHROPIC_API_KEY environment variable not set!")
+        print("Please set it with: export ANTHROPIC_API_KEY=your_key_here")
+        return
+    
+    print("\nGenerating with Claude 3.5 Sonnet...")
+    try:
+        generated_text = asyncio.run(call_llm(MODEL, prompt, temperature=TEMPERATURE, top_p=TOP_P, max_tokens=MAX_TOKENS))
+    except Exception as e:
+        print(f"Claude request failed: {e}")
+        generated_text = None
     
     if not generated_text:
         print("\nGeneration failed!")
@@ -1,65 +1,24 @@
 import os
+import csv
+import asyncio
 import pandas as pd
-from withpi import PiClient
+from _pi_async import make_pi_client, list_text_files, iter_text_files, score_stream
 
-def read_text_files(folder_path):
-    """Read all txt files from the folder"""
-    texts = {}
-    for filename in os.listdir(folder_path):
-        if filename.endswith('.txt'):
-            with open(os.path.join(folder_path, filename), 'r', encoding='utf-8') as f:
-                texts[filename] = f.read()
-    return texts
+# Result column for each PI question
+QUESTION_COLUMNS = {
+    'realism': 'Realism',
+    'prompt_adherence': 'Prompt Adherence',
+    'clarity': 'Clarity',
+    'factual_consistency': 'Factual Consistency',
+    'completeness': 'Completeness',
+    'technical_accuracy': 'Technical Accuracy'
+}
+NUMERIC_COLS = ['total_score', *QUESTION_COLUMNS]
+COLUMNS = ['model_name', *NUMERIC_COLS]
 
-def score_with_pi(pi_client, prompt, text, observations):
-    """Score a single text using PI scorer"""
-    
-    scoring_params = {
-        "llm_input": prompt,
-        "llm_output": text,
-        "scoring_spec": [
-            {
-                "label": "Realism",
-                "question": f"How realistic does the generated output look based on actual changelog/version file patterns? Consider these observations: {observations}"
-            },
-            {
-                "label": "Prompt Adherence",
-                "question": "How much does the generated text answer the prompt?"
-            },
-            {
-                "label": "Clarity",
-                "question": "How well can the content be understood? How much of the things are clarified in the generated text?"
-            },
-            {
-                "label": "Factual Consistency",
-                "question": "Does the generated text contain any contradictions or inconsistent information?"
-            },
-            {
-                "label": "Completeness",
-                "question": "Does the output cover all key aspects typically expected in a changelog/version file?"
-            },
-            {
-                "label": "Technical Accuracy",
-                "question": "Does the technical terminology and syntax appear correct and appropriate?"
-            }
-        ],
-    }
-    
-    response = pi_client.scoring_system.score(**scoring_params)
-    return response
-
-def main():
-    # Configuration
-    PI_API_KEY = input("Enter your PI API key: ").strip()
-    folder_path = input("Enter the folder path containing txt files: ").strip()
-    prompt_path = input("Enter the path to the prompt file (txt): ").strip()
-    output_csv = input("Enter output CSV filename (default: pi_scores.csv): ").strip()
-    
-    if not output_csv:
-        output_csv = "pi_scores.csv"
-    
-    # Your observations for the realism question
-    observations = """
+# Your observations for the realism question.
+# Kept byte-identical to the observations in cal_pi_scores.py, which calibrates against this spec
+OBSERVATIONS = """
     Technical jargon/syntax used (output syntax), numbers, unique ticket numbers.
     Occasionally sounds like code output, especially with errors.
     Pattern: <Error fixed> <What error was filed>.
@@ -73,57 +32,115 @@ def main():
     Version files are formal with occasional hype, exceptionally longer than changelog.
     Sentence pattern: <What the new thing does> <How it does it>.
     """
+
+# Scoring spec sent with every request, built once
+_SCORING_SPEC = [
+    {
+        "label": "Realism",
+        "question": f"How realistic does the generated output look based on actual changelog/version file patterns? Consider these observations: {OBSERVATIONS}"
+    },
+    {
+        "label": "Prompt Adherence",
+        "question": "How much does the generated text answer the prompt?"
+    },
+    {
+        "label": "Clarity",
+        "question": "How well can the content be understood? How much of the things are clarified in the generated text?"
+    },
+    {
+        "label": "Factual Consistency",
+        "question": "Does the generated text contain any contradictions or inconsistent information?"
+    },
+    {
+        "label": "Completeness",
+        "question": "Does the output cover all key aspects typically expected in a changelog/version file?"
+    },
+    {
+        "label": "Technical Accuracy",
+        "question": "Does the technical terminology and syntax appear correct and appropriate?"
+    }
+]
+
+def score_with_pi(pi_client, prompt, text):
+    """Score a single text using PI scorer"""
+    return pi_client.scoring_system.score(llm_input=prompt, llm_output=text, scoring_spec=_SCORING_SPEC)
+
+async def score_all(pi_client, prompt, text_items, n_texts, save_row, max_concurrency=16):
+    """Score texts concurrently as they are read
+
+    Each result is passed to save_row as a tuple in COLUMNS order as soon as it arrives.
+    Returns the number of texts scored.
+    """
+    def score_fn(text):
+        return score_with_pi(pi_client, prompt, text)
+    
+    def on_result(i, filename, response):
+        question_scores = response.question_scores
+        # Raw scores; rounding is done once on the whole DataFrame
+        save_row((
+            filename,
+            response.total_score,
+            *(question_scores.get(label, 0) for label in QUESTION_COLUMNS.values())
+        ))
+    
+    return await score_stream(score_fn, text_items, n_texts, on_result, max_concurrency, print_traceback=True)
+
+def main():
+    # Configuration
+    PI_API_KEY = input("Enter your PI API key: ").strip()
+    folder_path = input("Enter the folder path containing txt files: ").strip()
+    prompt_path = input("Enter the path to the prompt file (txt): ").strip()
+    max_concurrency = int(input("Maximum concurrent scoring requests (default 16): ").strip() or "16")
+    output_csv = input("Enter output CSV filename (default: pi_scores.csv): ").strip()
+    
+    if not output_csv:
+        output_csv = "pi_scores.csv"
     
     # Initialize PI client
     print("\nInitializing PI client...")
-    pi = PiClient(api_key=PI_API_KEY)
+    pi = make_pi_client(PI_API_KEY, max_connections=max_concurrency)
     
     # Read prompt
     print("Reading prompt...")
     with open(prompt_path, 'r', encoding='utf-8') as f:
         prompt = f.read()
     
-    # Read texts
-    print("Reading text files...")
-    texts = read_text_files(folder_path)
+    # List texts; their contents are read lazily as they are scored
+    print("Listing text files...")
+    filenames = list_text_files(folder_path)
     
-    if not texts:
+    if not filenames:
         print("No txt files found in the specified folder!")
         return
     
-    print(f"Found {len(texts)} text files")
+    print(f"Found {len(filenames)} text files")
     
-    # Score each text
-    results = []
-    print("\nScoring texts with PI judge...")
+    # Resume: texts already in the output CSV are not scored again
+    resuming = os.path.exists(output_csv) and os.path.getsize(output_csv) > 0
+    if resuming:
+        done = set(pd.read_csv(output_csv, usecols=['model_name'])['model_name'])
+        filenames = [filename for filename in filenames if filename not in done]
+        print(f"Resuming: {len(done)} texts already scored in {output_csv}, {len(filenames)} left")
     
-    for i, (filename, text) in enumerate(texts.items(), 1):
-        print(f"Scoring {i}/{len(texts)}: {filename}")
+    # Score all texts concurrently, writing each row as soon as it arrives so a crash loses no finished work
+    print(f"\nScoring texts with PI judge (up to {max_concurrency} concurrent requests)...")
+    with open(output_csv, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        if not resuming:
+            writer.writerow(COLUMNS)
+        
+        def save_row(row):
+            writer.writerow(row)
+            f.flush()
         
-        try:
-            response = score_with_pi(pi, prompt, text, observations)
-            question_scores = response.question_scores
-            
-            results.append({
-                'model_name': filename,
-                'total_score': round(response.total_score, 4),
-                'realism': round(question_scores.get('Realism', 0), 4),
-                'prompt_adherence': round(question_scores.get('Prompt Adherence', 0), 4),
-                'clarity': round(question_scores.get('Clarity', 0), 4),
-                'factual_consistency': round(question_scores.get('Factual Consistency', 0), 4),
-                'completeness': round(question_scores.get('Completeness', 0), 4),
-                'technical_accuracy': round(question_scores.get('Technical Accuracy', 0), 4)
-            })
-            
-        except Exception as e:
-            print(f"Error scoring {filename}: {e}")
-            import traceback
-            traceback.print_exc()
-            continue
+        asyncio.run(score_all(
+            pi, prompt, iter_text_files(folder_path, filenames), len(filenames), save_row, max_concurrency
+        ))
     
-    # Create DataFrame and save
-    if results:
-        df = pd.DataFrame(results)
+    # Reload the streamed rows and rewrite them rounded and sorted
+    df = pd.read_csv(output_csv)
+    if len(df):
+        df[NUMERIC_COLS] = df[NUMERIC_COLS].round(4)
         df = df.sort_values('total_score', ascending=False)
         df.to_csv(output_csv, index=False)
         